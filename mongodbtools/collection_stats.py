@@ -10,6 +10,7 @@ import psutil
 from pymongo import MongoClient
 from pymongo import ReadPreference
 from optparse import OptionParser
+from mongodbtools.stats_frame import StatsFrame
 
 def compute_signature(index):
     signature = index["ns"]
@@ -40,6 +41,12 @@ def get_cli_options():
                       default="",
                       metavar="DATABASE",
                       help="Target database to generate statistics. All if omitted.")
+    parser.add_option("-n", "--top",
+                      dest="top",
+                      default=0,
+                      type="int",
+                      metavar="ROWS",
+                      help="Only show the largest ROWS collections. All if omitted.")
     parser.add_option("-u", "--user",
                       dest="user",
                       default="",
@@ -53,6 +60,9 @@ def get_cli_options():
 
     (options, args) = parser.parse_args()
 
+    if options.top < 0:
+        parser.error("--top must be 0 or more")
+
     return options
 
 def get_client(host, port, username, password):
@@ -86,16 +96,9 @@ def convert_bytes(bytes):
     return size
 
 def main(options):
-    summary_stats = {
-        "count" : 0,
-        "size" : 0,
-        "indexSize" : 0,
-        "storageSize" : 0
-    }
-    all_stats = []
+    frame = StatsFrame(["count", "size", "nindexes", "totalIndexSize", "storageSize"])
 
     client = get_client(options.host, options.port, options.user, options.password)
-    all_db_stats = {}
 
     databases= []
     if options.database:
@@ -109,16 +112,9 @@ def main(options):
             continue
 
         database = client[db]
-        all_db_stats[database.name] = []
         for collection_name in database.collection_names():
             stats = get_collection_stats(database, database[collection_name])
-            all_stats.append(stats)
-            all_db_stats[database.name].append(stats)
-
-            summary_stats["count"] += stats["count"]
-            summary_stats["size"] += stats["size"]
-            summary_stats["indexSize"] += stats.get("totalIndexSize", 0)
-            summary_stats["storageSize"] += stats.get("storageSize", 0)
+            frame.append(database.name, stats["ns"], stats)
 
     x = PrettyTable(["Collection", "Count", "% Size", "DB Size", "Avg Obj Size", "Indexes", "Index Size", "Storage Size"])
     x.align["Collection"]  = "l"
@@ -132,29 +128,66 @@ def main(options):
 
     print
 
-    for db in all_db_stats:
-        db_stats = all_db_stats[db]
-        count = 0
-        for stat in db_stats:
-            count += stat["count"]
-            x.add_row([stat["ns"], stat["count"], "%0.1f%%" % ((stat["size"] / float(summary_stats["size"])) * 100),
-                       convert_bytes(stat["size"]),
-                       convert_bytes(stat.get("avgObjSize", 0)),
-                       stat.get("nindexes", 0),
-                       convert_bytes(stat.get("totalIndexSize", 0)),
-                       convert_bytes(stat.get("storageSize", 0))
-                       ])
+    counts = frame.column("count")
+    sizes = frame.column("size")
+    percents = frame.percent("size")
+    avg_obj_sizes = frame.ratio("size", "count")
+    nindexes = frame.column("nindexes")
+    index_sizes = frame.column("totalIndexSize")
+    storage_sizes = frame.column("storageSize")
+    for i in frame.top("size", options.top):
+        x.add_row([frame.labels[i], counts[i], "%0.1f%%" % percents[i],
+                   convert_bytes(sizes[i]),
+                   convert_bytes(avg_obj_sizes[i]),
+                   nindexes[i],
+                   convert_bytes(index_sizes[i]),
+                   convert_bytes(storage_sizes[i])
+                   ])
+
+    print
+    print x
+    if options.top and len(frame) > options.top:
+        print "Showing the %s largest of %s collections" % (options.top, len(frame))
+
+    x = PrettyTable(["Database", "Collections", "Count", "% Size", "DB Size", "Index Size", "Storage Size"])
+    x.align["Database"] = "l"
+    x.align["Collections"] = "r"
+    x.align["Count"] = "r"
+    x.align["% Size"] = "r"
+    x.align["DB Size"] = "r"
+    x.align["Index Size"] = "r"
+    x.align["Storage Size"] = "r"
+    x.padding_width = 1
+
+    db_collections = frame.group_count()
+    db_counts = frame.group_sum("count")
+    db_sizes = frame.group_sum("size")
+    db_percents = db_sizes * 100.0 / max(db_sizes.sum(), 1)
+    db_index_sizes = frame.group_sum("totalIndexSize")
+    db_storage_sizes = frame.group_sum("storageSize")
+    for i in db_sizes.argsort()[::-1]:
+        x.add_row([frame.databases[i], db_collections[i], db_counts[i], "%0.1f%%" % db_percents[i],
+                   convert_bytes(db_sizes[i]),
+                   convert_bytes(db_index_sizes[i]),
+                   convert_bytes(db_storage_sizes[i])
+                   ])
 
     print
-    print x.get_string(sortby="% Size")
-    print "Total Documents:", summary_stats["count"]
-    print "Total Data Size:", convert_bytes(summary_stats["size"])
-    print "Total Index Size:", convert_bytes(summary_stats["indexSize"])
-    print "Total Storage Size:", convert_bytes(summary_stats["storageSize"])
+    print x
+
+    total_size = frame.total("size")
+    total_index_size = frame.total("totalIndexSize")
+    print "Total Collections:", len(frame)
+    print "Total Documents:", frame.total("count")
+    print "Total Data Size:", convert_bytes(total_size)
+    print "Total Index Size:", convert_bytes(total_index_size)
+    print "Total Storage Size:", convert_bytes(frame.total("storageSize"))
+    print "Collection Size p50/p90/p99: %s" % "/".join(
+        convert_bytes(q) for q in frame.quantiles("size", [50, 90, 99]))
 
     # this is only meaningful if we're running the script on localhost
     if options.host == "localhost":
-        ram_headroom = psutil.virtual_memory().total - summary_stats["indexSize"]
+        ram_headroom = psutil.virtual_memory().total - total_index_size
         print "RAM Headroom:", convert_bytes(ram_headroom)
         print "RAM Used: %s (%s%%)" % (convert_bytes(psutil.virtual_memory().used), psutil.virtual_memory().percent)
         print "Available RAM Headroom:", convert_bytes((100 - psutil.virtual_memory().percent) / 100 * ram_headroom)
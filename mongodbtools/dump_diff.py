@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+"""
+This script compares two .bson files created with mongodump, for example
+yesterday's and today's dump of a collection, and prints the documents that
+were inserted, deleted or changed.
+
+Both files are streamed and matched up by _id.  Only the _id, a hash and the
+file offset of each doc are kept, so the full docs are decoded only when their
+hashes differ.  Files that aren't ordered by _id are sorted with an external
+merge sort in temporary files, which keeps memory bounded for large dumps.
+"""
+import sys
+import os
+import heapq
+import shutil
+import struct
+import hashlib
+import tempfile
+from optparse import OptionParser
+import bson
+from bson import json_util
+from mongodbtools.query.helpers import bson_raw_iter, raw_id
+
+# key length, doc offset, then the 16 byte md5 digest followed by the key.
+RECORD_HEADER = struct.Struct("<IQ16s")
+
+# Maximum number of runs merged at once, which bounds the open files.
+MAX_FAN_IN = 64
+
+def raw_entries(bson_file):
+    """
+    Yields (id, digest, offset) for each doc of a .bson file.
+    """
+    offset = 0
+    for raw in bson_raw_iter(bson_file):
+        yield raw_id(raw), hashlib.md5(raw).digest(), offset
+        offset += len(raw)
+
+def is_sorted(bson_file):
+    last = None
+    for raw in bson_raw_iter(bson_file):
+        key = raw_id(raw)
+        if last is not None and key < last:
+            return False
+        last = key
+    return True
+
+def _write_run(entries, tmpdir):
+    """
+    Writes already sorted entries to a new run file in tmpdir.
+    """
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmpdir)
+    with os.fdopen(fd, "wb") as run:
+        for key, digest, offset in entries:
+            run.write(RECORD_HEADER.pack(len(key), offset, digest))
+            run.write(key)
+    return path
+
+def _read_run(path):
+    with open(path, "rb") as run:
+        while True:
+            header = run.read(RECORD_HEADER.size)
+            if not header:
+                break
+            key_size, offset, digest = RECORD_HEADER.unpack(header)
+            yield run.read(key_size), digest, offset
+
+def _merge_runs(runs, tmpdir, fan_in=MAX_FAN_IN):
+    """
+    Merges runs fan_in at a time into new runs until at most fan_in are left,
+    removing the merged ones.
+    """
+    while len(runs) > fan_in:
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i:i + fan_in]
+            merged.append(_write_run(heapq.merge(*[_read_run(run) for run in group]), tmpdir))
+            for run in group:
+                os.remove(run)
+        runs = merged
+    return runs
+
+def sorted_entries(path, tmpdir, chunk_size=500000, fan_in=MAX_FAN_IN):
+    """
+    Yields (id, digest, offset) for each doc of the .bson file at path in _id
+    order.  Unless the file is already ordered the entries are sorted in
+    chunks of chunk_size, written to runs in tmpdir and merged back, at most
+    fan_in runs at a time.
+    """
+    with open(path, "rb") as bson_file:
+        if is_sorted(bson_file):
+            bson_file.seek(0)
+            for entry in raw_entries(bson_file):
+                yield entry
+            return
+
+    runs = []
+    chunk = []
+    with open(path, "rb") as bson_file:
+        for entry in raw_entries(bson_file):
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                chunk.sort()
+                runs.append(_write_run(chunk, tmpdir))
+                chunk = []
+    if chunk:
+        chunk.sort()
+        runs.append(_write_run(chunk, tmpdir))
+    chunk = None
+
+    runs = _merge_runs(runs, tmpdir, fan_in)
+    for entry in heapq.merge(*[_read_run(run) for run in runs]):
+        yield entry
+
+def read_doc(bson_file, offset):
+    bson_file.seek(offset)
+    size_str = bson_file.read(4)
+    obj_size = struct.unpack("<i", size_str)[0]
+    return bson.BSON(size_str + bson_file.read(obj_size - 4)).decode()
+
+def diff_dumps(old_path, new_path, tmpdir=None, chunk_size=500000, fan_in=MAX_FAN_IN,
+               decode=True):
+    """
+    Compares two .bson files and yields ("insert", None, new_doc),
+    ("delete", old_doc, None) and ("change", old_doc, new_doc) tuples in _id
+    order.  With decode=False nothing is decoded and the file offsets of the
+    docs are yielded instead of the docs.
+    """
+    def doc(bson_file, entry):
+        if decode:
+            return read_doc(bson_file, entry[2])
+        return entry[2]
+
+    workdir = tempfile.mkdtemp(prefix="dump-diff-", dir=tmpdir)
+    try:
+        with open(old_path, "rb") as old_file:
+            with open(new_path, "rb") as new_file:
+                old_entries = sorted_entries(old_path, workdir, chunk_size, fan_in)
+                new_entries = sorted_entries(new_path, workdir, chunk_size, fan_in)
+                old = next(old_entries, None)
+                new = next(new_entries, None)
+                while old is not None or new is not None:
+                    if new is None or (old is not None and old[0] < new[0]):
+                        yield "delete", doc(old_file, old), None
+                        old = next(old_entries, None)
+                    elif old is None or new[0] < old[0]:
+                        yield "insert", None, doc(new_file, new)
+                        new = next(new_entries, None)
+                    else:
+                        if old[1] != new[1]:
+                            yield "change", doc(old_file, old), doc(new_file, new)
+                        old = next(old_entries, None)
+                        new = next(new_entries, None)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def changed_fields(old_doc, new_doc):
+    fields = []
+    for key in old_doc:
+        if key not in new_doc or old_doc[key] != new_doc[key]:
+            fields.append(key)
+    for key in new_doc:
+        if key not in old_doc:
+            fields.append(key)
+    return fields
+
+def get_cli_options():
+    parser = OptionParser(usage="usage: python %prog [options] OLD.bson NEW.bson",
+                          description="""This script prints the documents inserted, deleted or changed between two mongodump .bson files as JSON lines.""")
+
+    parser.add_option("-t", "--tmpdir",
+                      dest="tmpdir",
+                      default=None,
+                      metavar="DIR",
+                      help="Directory for the sort runs of files not ordered by _id")
+    parser.add_option("--chunk-size",
+                      dest="chunk_size",
+                      default=500000,
+                      type="int",
+                      metavar="DOCS",
+                      help="Number of docs sorted in memory at once")
+    parser.add_option("-s", "--summary",
+                      dest="summary",
+                      default=False,
+                      action="store_true",
+                      help="Only print the number of inserted, deleted and changed documents")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 2:
+        parser.error("OLD.bson and NEW.bson are required")
+    options.old, options.new = args
+
+    return options
+
+def main(options):
+    counts = {"insert": 0, "delete": 0, "change": 0}
+
+    for op, old_doc, new_doc in diff_dumps(options.old, options.new, options.tmpdir, options.chunk_size,
+                                           decode=not options.summary):
+        counts[op] += 1
+        if options.summary:
+            continue
+
+        if op == "insert":
+            line = {"op": op, "_id": new_doc["_id"], "doc": new_doc}
+        elif op == "delete":
+            line = {"op": op, "_id": old_doc["_id"], "doc": old_doc}
+        else:
+            line = {"op": op, "_id": new_doc["_id"], "fields": changed_fields(old_doc, new_doc),
+                    "old": old_doc, "new": new_doc}
+        print json_util.dumps(line)
+
+    print >> sys.stderr, "Inserted:", counts["insert"]
+    print >> sys.stderr, "Deleted:", counts["delete"]
+    print >> sys.stderr, "Changed:", counts["change"]
+
+if __name__ == "__main__":
+    options = get_cli_options()
+    main(options)
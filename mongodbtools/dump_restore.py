@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+
+"""
+This script reloads documents from .bson files created with mongodump into a
+collection, optionally only the ones matching a query.  This is useful to
+restore a subset of a collection after an incident.
+
+Documents are written in batches sized by bytes by several writer threads.
+The batch size adapts to how fast the server accepts them.  With --checkpoint
+the offset up to which every document has been written is saved after each
+batch, so an interrupted restore picks up where it left off.
+"""
+import os
+import sys
+import time
+import json
+import threading
+import Queue
+from optparse import OptionParser
+import bson
+from bson import json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import MongoClient
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from mongodbtools.query.helpers import bson_raw_iter, raw_id
+
+DUPLICATE_KEY = 11000
+MISSING = object()
+
+class BatchSizer(object):
+    """
+    Picks the number of bytes per batch so that each write takes about
+    target_seconds, based on the throughput of the batches written so far.
+    """
+    def __init__(self, batch_bytes=1048576, min_bytes=65536, max_bytes=16777216,
+                 target_seconds=0.5):
+        self.batch_bytes = batch_bytes
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.target_seconds = target_seconds
+        self.lock = threading.Lock()
+
+    def record(self, nbytes, seconds):
+        wanted = nbytes / max(seconds, 0.001) * self.target_seconds
+        with self.lock:
+            # Move half way towards the wanted size so one slow batch doesn't
+            # swing the size too far.
+            batch_bytes = (self.batch_bytes + wanted) / 2
+            self.batch_bytes = int(min(max(batch_bytes, self.min_bytes), self.max_bytes))
+
+class Checkpoint(object):
+    """
+    Tracks per file the offset before which every document has been written.
+    Batches finish out of order when there are several writers, so the offset
+    only moves forward once all earlier batches are done too.  Files are keyed
+    by their absolute path so a resume can name them differently.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.offsets = {}
+        self.done = {}
+        self.next_seq = 0
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                self.offsets = json.load(checkpoint_file)
+
+    def offset(self, bson_path):
+        return self.offsets.get(os.path.abspath(bson_path), 0)
+
+    def finish(self, seq, bson_path, end_offset):
+        with self.lock:
+            self.done[seq] = (os.path.abspath(bson_path), end_offset)
+            if seq != self.next_seq:
+                return
+            while self.next_seq in self.done:
+                bson_path, end_offset = self.done.pop(self.next_seq)
+                self.offsets[bson_path] = end_offset
+                self.next_seq += 1
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump(self.offsets, checkpoint_file)
+        os.rename(tmp_path, self.path)
+
+class RestoreStats(object):
+    def __init__(self):
+        self.scanned = 0
+        self.matched = 0
+        self.written = 0
+        self.duplicates = 0
+        self.bytes = 0
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def add_batch(self, written, duplicates, nbytes):
+        with self.lock:
+            self.written += written
+            self.duplicates += duplicates
+            self.bytes += nbytes
+            self.batches += 1
+
+def get_path(doc, field):
+    """
+    Returns the value at a dotted field path, descending only through embedded
+    documents, or MISSING when the path doesn't exist.
+    """
+    value = doc
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def matches(doc, query):
+    """
+    Returns whether every field of query equals the doc's value at that path.
+    A path that doesn't exist in the doc never matches.
+    """
+    for field, value in query.items():
+        found = get_path(doc, field)
+        if found is MISSING or found != value:
+            return False
+    return True
+
+def read_batches(bson_path, offset, query, sizer, stats):
+    """
+    Yields (docs, nbytes, end_offset) batches of the docs in the .bson file
+    matching query, starting at offset.  A final, possibly empty, batch ending
+    at the end of the file is always yielded so the checkpoint reaches it.
+    """
+    # Dates are decoded tz aware like json_util.loads gives them in query.
+    codec_options = CodecOptions(tz_aware=True)
+    docs = []
+    nbytes = 0
+    with open(bson_path, "rb") as bson_file:
+        bson_file.seek(offset)
+        for raw in bson_raw_iter(bson_file):
+            offset += len(raw)
+            stats.scanned += 1
+            if query and not matches(bson.BSON(raw).decode(codec_options), query):
+                continue
+
+            stats.matched += 1
+            docs.append(RawBSONDocument(raw))
+            nbytes += len(raw)
+            if nbytes >= sizer.batch_bytes:
+                yield docs, nbytes, offset
+                docs = []
+                nbytes = 0
+    yield docs, nbytes, offset
+
+def write_batch(collection, docs, mode="insert", ordered=False):
+    """
+    Writes the RawBSONDocuments in docs and returns (written, duplicates,
+    written_bytes).  Inserts that fail only because the _id already exists, as
+    happens for the batches written after the checkpoint of an interrupted
+    restore, are counted as duplicates.  Any other error, including a
+    duplicate key on another unique index, is raised.
+    """
+    if not docs:
+        return 0, 0, 0
+
+    if mode == "replace":
+        requests = [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs]
+        collection.bulk_write(requests, ordered=ordered)
+        return len(docs), 0, sum(len(doc.raw) for doc in docs)
+
+    written = 0
+    duplicates = 0
+    written_bytes = 0
+    while docs:
+        try:
+            collection.insert_many(docs, ordered=ordered)
+            written += len(docs)
+            written_bytes += sum(len(doc.raw) for doc in docs)
+            break
+        except BulkWriteError as e:
+            exc_info = sys.exc_info()
+            errors = e.details["writeErrors"]
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            written += e.details["nInserted"]
+            failed = set(error["index"] for error in errors)
+
+            # An ordered insert stops at the first error.  When one batch was
+            # already written most of the rest are duplicates too, so the
+            # ones that exist are dropped with the same query that checks the
+            # errors, instead of a round trip each.
+            if ordered:
+                index = errors[0]["index"]
+                written_bytes += sum(len(doc.raw) for doc in docs[:index])
+                docs = docs[index:]
+                failed_docs = docs[:1]
+            else:
+                written_bytes += sum(len(doc.raw) for i, doc in enumerate(docs) if i not in failed)
+                docs = failed_docs = [doc for i, doc in enumerate(docs) if i in failed]
+
+            # The same error code is used by every unique index, so only the
+            # docs whose _id is already there are duplicates.
+            existing = set(raw_id(doc.raw) for doc in _find_ids(collection, docs))
+            if any(raw_id(doc.raw) not in existing for doc in failed_docs):
+                raise exc_info[0], exc_info[1], exc_info[2]
+            remaining = [doc for doc in docs if raw_id(doc.raw) not in existing]
+            duplicates += len(docs) - len(remaining)
+            docs = remaining
+            if not ordered:
+                break
+    return written, duplicates, written_bytes
+
+def _find_ids(collection, docs):
+    if not docs:
+        return []
+    collection = collection.with_options(
+        codec_options=CodecOptions(document_class=RawBSONDocument))
+    return collection.find({"_id": {"$in": [doc["_id"] for doc in docs]}}, {"_id": 1})
+
+def restore(collection, bson_paths, query=None, mode="insert", ordered=False,
+            writers=4, sizer=None, checkpoint=None, stats=None):
+    if writers < 1:
+        raise ValueError("writers must be 1 or more, got %s" % writers)
+    sizer = sizer or BatchSizer()
+    checkpoint = checkpoint or Checkpoint()
+    stats = stats or RestoreStats()
+    batches = Queue.Queue(maxsize=writers * 2)
+    errors = []
+
+    def writer():
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            seq, bson_path, docs, nbytes, end_offset = batch
+            if errors:
+                continue
+            try:
+                start = time.time()
+                written, duplicates, written_bytes = write_batch(collection, docs, mode, ordered)
+                if docs:
+                    sizer.record(nbytes, time.time() - start)
+                    stats.add_batch(written, duplicates, written_bytes)
+                checkpoint.finish(seq, bson_path, end_offset)
+            except Exception:
+                errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=writer) for i in range(writers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        seq = 0
+        for bson_path in bson_paths:
+            offset = checkpoint.offset(bson_path)
+            for docs, nbytes, end_offset in read_batches(bson_path, offset, query, sizer, stats):
+                if errors:
+                    break
+                batches.put((seq, bson_path, docs, nbytes, end_offset))
+                seq += 1
+            if errors:
+                break
+    finally:
+        for thread in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return stats
+
+def get_cli_options():
+    parser = OptionParser(usage="usage: python %prog [options] FILE.bson [FILE.bson ...]",
+                          description="""This script loads the documents of mongodump .bson files matching a query into a collection.""")
+
+    parser.add_option("-H", "--host",
+                      dest="host",
+                      default="localhost",
+                      metavar="HOST",
+                      help="MongoDB host")
+    parser.add_option("-p", "--port",
+                      dest="port",
+                      default=27017,
+                      metavar="PORT",
+                      help="MongoDB port")
+    parser.add_option("-d", "--database",
+                      dest="database",
+                      default="",
+                      metavar="DATABASE",
+                      help="Target database")
+    parser.add_option("-c", "--collection",
+                      dest="collection",
+                      default="",
+                      metavar="COLLECTION",
+                      help="Target collection")
+    parser.add_option("-q", "--query",
+                      dest="query",
+                      default="",
+                      metavar="QUERY",
+                      help="""Only restore docs whose fields equal these values, e.g. '{"type": "active", "address.zip": 10001}'""")
+    parser.add_option("--replace",
+                      dest="replace",
+                      default=False,
+                      action="store_true",
+                      help="Upsert docs by _id instead of inserting them")
+    parser.add_option("--ordered",
+                      dest="ordered",
+                      default=False,
+                      action="store_true",
+                      help="Use ordered writes within each batch")
+    parser.add_option("-w", "--writers",
+                      dest="writers",
+                      default=4,
+                      type="int",
+                      metavar="THREADS",
+                      help="Number of parallel writers")
+    parser.add_option("--batch-bytes",
+                      dest="batch_bytes",
+                      default=1048576,
+                      type="int",
+                      metavar="BYTES",
+                      help="Initial batch size in bytes, adjusted as batches are written")
+    parser.add_option("--max-batch-bytes",
+                      dest="max_batch_bytes",
+                      default=16777216,
+                      type="int",
+                      metavar="BYTES",
+                      help="Maximum batch size in bytes")
+    parser.add_option("--checkpoint",
+                      dest="checkpoint",
+                      default="",
+                      metavar="FILE",
+                      help="File recording the progress of the restore. An existing one is resumed from.")
+    parser.add_option("-u", "--user",
+                      dest="user",
+                      default="",
+                      metavar="USER",
+                      help="Admin username if authentication is enabled")
+    parser.add_option("--password",
+                      dest="password",
+                      default="",
+                      metavar="PASSWORD",
+                      help="Admin password if authentication is enabled")
+
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error("at least one .bson file is required")
+    if not (options.database and options.collection):
+        parser.error("--database and --collection are required")
+    if options.writers < 1:
+        parser.error("--writers must be 1 or more")
+    options.files = args
+
+    return options
+
+def get_client(host, port, username, password):
+    userPass = ""
+    if username and password:
+        userPass = username + ":" + password + "@"
+
+    mongoURI = "mongodb://" + userPass + host + ":" + str(port)
+    return MongoClient(mongoURI)
+
+# From http://www.5dollarwhitebox.org/drupal/node/84
+def convert_bytes(bytes):
+    bytes = float(bytes)
+    magnitude = abs(bytes)
+    if magnitude >= 1099511627776:
+        terabytes = bytes / 1099511627776
+        size = '%.2fT' % terabytes
+    elif magnitude >= 1073741824:
+        gigabytes = bytes / 1073741824
+        size = '%.2fG' % gigabytes
+    elif magnitude >= 1048576:
+        megabytes = bytes / 1048576
+        size = '%.2fM' % megabytes
+    elif magnitude >= 1024:
+        kilobytes = bytes / 1024
+        size = '%.2fK' % kilobytes
+    else:
+        size = '%.2fb' % bytes
+    return size
+
+def main(options):
+    client = get_client(options.host, options.port, options.user, options.password)
+    collection = client[options.database][options.collection]
+    query = json_util.loads(options.query) if options.query else None
+    sizer = BatchSizer(options.batch_bytes, max_bytes=options.max_batch_bytes)
+    checkpoint = Checkpoint(options.checkpoint)
+    stats = RestoreStats()
+
+    print "Restoring into: %s" % collection.full_name
+    start = time.time()
+    restore(collection, options.files, query,
+            mode="replace" if options.replace else "insert",
+            ordered=options.ordered,
+            writers=options.writers,
+            sizer=sizer,
+            checkpoint=checkpoint,
+            stats=stats)
+    elapsed = max(time.time() - start, 0.001)
+
+    print
+    print "Documents Scanned:", stats.scanned
+    print "Documents Matched:", stats.matched
+    print "Documents Written:", stats.written
+    print "Duplicates Skipped:", stats.duplicates
+    print "Data Written:", convert_bytes(stats.bytes)
+    print "Batches: %s (last batch size %s)" % (stats.batches, convert_bytes(sizer.batch_bytes))
+    print "Elapsed: %.1fs" % elapsed
+    print "Throughput: %.0f docs/s, %s/s" % (stats.written / elapsed, convert_bytes(stats.bytes / elapsed))
+
+if __name__ == "__main__":
+    options = get_cli_options()
+    main(options)
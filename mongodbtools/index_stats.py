@@ -10,6 +10,7 @@ import psutil
 from pymongo import MongoClient
 from pymongo import ReadPreference
 from optparse import OptionParser
+from mongodbtools.stats_frame import StatsFrame
 
 def compute_signature(index):
     signature = index["ns"]
@@ -60,6 +61,12 @@ def get_cli_options():
                       default="",
                       metavar="DATABASE",
                       help="Target database to generate statistics. All if omitted.")
+    parser.add_option("-n", "--top",
+                      dest="top",
+                      default=0,
+                      type="int",
+                      metavar="ROWS",
+                      help="Only show the largest ROWS indexes in the overview. All if omitted.")
     parser.add_option("-u", "--user",
                       dest="user",
                       default="",
@@ -73,6 +80,9 @@ def get_cli_options():
 
     (options, args) = parser.parse_args()
 
+    if options.top < 0:
+        parser.error("--top must be 0 or more")
+
     return options
 
 def get_client(host, port, username, password):
@@ -84,17 +94,11 @@ def get_client(host, port, username, password):
     return MongoClient(mongoURI)
 
 def main(options):
-    summary_stats = {
-        "count" : 0,
-        "size" : 0,
-        "indexSize" : 0
-    }
-    all_stats = []
+    collections = StatsFrame(["count", "size", "totalIndexSize"])
+    indexes = StatsFrame(["size"])
 
     client = get_client(options.host, options.port, options.user, options.password)
 
-    all_db_stats = {}
-
     databases = []
     if options.database:
         databases.append(options.database)
@@ -107,15 +111,11 @@ def main(options):
             continue
 
         database = client[db]
-        all_db_stats[database.name] = []
         for collection_name in database.collection_names():
             stats = get_collection_stats(database, database[collection_name])
-            all_stats.append(stats)
-            all_db_stats[database.name].append(stats)
-
-            summary_stats["count"] += stats["count"]
-            summary_stats["size"] += stats["size"]
-            summary_stats["indexSize"] += stats.get("totalIndexSize", 0)
+            collections.append(database.name, stats["ns"], stats)
+            for index, index_size in stats.get("indexSizes", {}).items():
+                indexes.append(database.name, (stats["ns"], index), {"size": index_size})
 
     x = PrettyTable(["Collection", "Index","% Size", "Index Size"])
     x.align["Collection"] = "l"
@@ -126,23 +126,17 @@ def main(options):
 
     print
 
-    index_size_mapping = {}
-    for db in all_db_stats:
-        db_stats = all_db_stats[db]
-        count = 0
-        for stat in db_stats:
-            count += stat["count"]
-            for index in stat["indexSizes"]:
-                index_size = stat["indexSizes"].get(index, 0)
-                row = [stat["ns"], index,
-                          "%0.1f%%" % ((index_size / float(summary_stats["indexSize"])) * 100),
-                  convert_bytes(index_size)]
-                index_size_mapping[index_size] = row
-                x.add_row(row)
-
+    index_sizes = indexes.column("size")
+    percents = indexes.percent("size")
+    rows = indexes.top("size", options.top)
+    for i in sorted(rows, key=lambda i: indexes.labels[i]):
+        ns, index = indexes.labels[i]
+        x.add_row([ns, index, "%0.1f%%" % percents[i], convert_bytes(index_sizes[i])])
 
     print "Index Overview"
-    print x.get_string(sortby="Collection")
+    print x
+    if options.top and len(indexes) > options.top:
+        print "Showing the %s largest of %s indexes" % (options.top, len(indexes))
 
     print
     print "Top 5 Largest Indexes"
@@ -153,19 +147,22 @@ def main(options):
     x.align["Index Size"] = "r"
     x.padding_width = 1
 
-    top_five_indexes = sorted(index_size_mapping.keys(), reverse=True)[0:5]
-    for size in top_five_indexes:
-        x.add_row(index_size_mapping.get(size))
+    for i in indexes.top("size", 5):
+        ns, index = indexes.labels[i]
+        x.add_row([ns, index, "%0.1f%%" % percents[i], convert_bytes(index_sizes[i])])
     print x
     print
 
-    print "Total Documents:", summary_stats["count"]
-    print "Total Data Size:", convert_bytes(summary_stats["size"])
-    print "Total Index Size:", convert_bytes(summary_stats["indexSize"])
+    total_index_size = collections.total("totalIndexSize")
+    print "Total Documents:", collections.total("count")
+    print "Total Data Size:", convert_bytes(collections.total("size"))
+    print "Total Index Size:", convert_bytes(total_index_size)
+    print "Index Size p50/p90/p99: %s" % "/".join(
+        convert_bytes(q) for q in indexes.quantiles("size", [50, 90, 99]))
 
     # this is only meaningful if we're running the script on localhost
     if options.host == "localhost":
-        ram_headroom = psutil.virtual_memory().total - summary_stats["indexSize"]
+        ram_headroom = psutil.virtual_memory().total - total_index_size
         print "RAM Headroom:", convert_bytes(ram_headroom)
         print "RAM Used: %s (%s%%)" % (convert_bytes(psutil.virtual_memory().used), psutil.virtual_memory().percent)
         print "Available RAM Headroom:", convert_bytes((100 - psutil.virtual_memory().percent) / 100 * ram_headroom)
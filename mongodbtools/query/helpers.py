@@ -1,29 +1,98 @@
 import bson, struct
 import itertools
+from bson.codec_options import CodecOptions
 from bson.errors import InvalidBSON
 
 
 # Helper functions work working with bson files created using mongodump
 
-def bson_iter(bson_file):
+def bson_raw_iter(bson_file):
     """
-    Takes a file handle to a .bson file and returns an iterator for each
-    doc in the file.  This will not load all docs into memory.
+    Takes a file handle to a .bson file and returns an iterator of the raw,
+    undecoded bytes of each doc in the file.  Useful when only the size or
+    a hash of the doc is needed since nothing is decoded.
 
     with open('User.bson', 'rb') as bs:
-        active_users = filter(bson_iter(bs), "type", "active")
+        total_size = sum(len(raw) for raw in bson_raw_iter(bs))
 
     """
     while True:
         size_str = bson_file.read(4)
         if not len(size_str):
             break
+        if len(size_str) != 4:
+            raise InvalidBSON("cut off in middle of objsize")
 
         obj_size = struct.unpack("<i", size_str)[0]
+        if obj_size < 5:
+            raise InvalidBSON("invalid object size %d" % obj_size)
         obj = bson_file.read(obj_size - 4)
-        if obj[-1] != "\x00":
+        if len(obj) != obj_size - 4 or obj[-1] != "\x00":
             raise InvalidBSON("bad eoo")
-        yield bson._bson_to_dict(size_str + obj, dict, True)[0]
+        yield size_str + obj
+
+def bson_iter(bson_file):
+    """
+    Takes a file handle to a .bson file and returns an iterator for each
+    doc in the file.  This will not load all docs into memory.
+
+    with open('User.bson', 'rb') as bs:
+        active_users = filter(bson_iter(bs), "type", "active")
+
+    """
+    for raw in bson_raw_iter(bson_file):
+        yield bson.BSON(raw).decode(CodecOptions(tz_aware=True))
+
+# Size of the value for the fixed width BSON types.
+FIXED_SIZES = {
+    0x01: 8, 0x06: 0, 0x07: 12, 0x08: 1, 0x09: 8, 0x0A: 0,
+    0x10: 4, 0x11: 8, 0x12: 8, 0x13: 16, 0xFF: 0, 0x7F: 0,
+}
+
+def raw_value_end(data, element_type, pos):
+    """
+    Returns the offset just past the value of an element of element_type
+    that starts at pos in the raw bson data.
+    """
+    if element_type in FIXED_SIZES:
+        return pos + FIXED_SIZES[element_type]
+    elif element_type in (0x02, 0x0D, 0x0E):
+        return pos + 4 + struct.unpack_from("<i", data, pos)[0]
+    elif element_type == 0x0C:
+        return pos + 4 + struct.unpack_from("<i", data, pos)[0] + 12
+    elif element_type == 0x05:
+        return pos + 5 + struct.unpack_from("<i", data, pos)[0]
+    elif element_type == 0x0B:
+        return data.index("\x00", data.index("\x00", pos) + 1) + 1
+    elif element_type in (0x03, 0x04, 0x0F):
+        return pos + struct.unpack_from("<i", data, pos)[0]
+    raise InvalidBSON("unknown type 0x%02x" % element_type)
+
+def raw_elements(data):
+    """
+    Iterates over the top level elements of a raw bson doc without decoding
+    them.  Yields (element_type, key, value_start, value_end) tuples.
+    """
+    end = struct.unpack_from("<i", data, 0)[0] - 1
+    pos = 4
+    while pos < end:
+        element_type = ord(data[pos])
+        key_end = data.index("\x00", pos + 1)
+        value_end = raw_value_end(data, element_type, key_end + 1)
+        yield element_type, data[pos + 1:key_end], key_end + 1, value_end
+        pos = value_end
+
+def raw_id(raw):
+    """
+    Returns the _id of a raw doc as its bson type byte followed by the encoded
+    value.  This compares and orders ids without decoding them, although it
+    isn't the server's sort order and ids of different numeric types (1 vs 1L
+    vs 1.0) don't match each other.
+    """
+    for element_type, key, value_start, value_end in raw_elements(raw):
+        if key == "_id":
+            return chr(element_type) + raw[value_start:value_end]
+    raise InvalidBSON("doc has no _id")
 
 def _deep_get(obj, field):
     parts = field.split(".")
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+"""
+This script profiles the schema of a collection, either from a .bson file
+created with mongodump or by sampling a live collection.  For every field path
+it reports the types seen, how often the field is present, array lengths and
+how many bytes the field contributes to the average document size.
+"""
+import struct
+from optparse import OptionParser
+from prettytable import PrettyTable
+from pymongo import MongoClient
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidBSON
+from bson.raw_bson import RawBSONDocument
+from mongodbtools.query.helpers import bson_raw_iter, raw_value_end
+
+# Keys beyond the cap of a node, or beyond the node budget of the whole tree,
+# are folded into this leaf so that collections using values as keys (dates,
+# ids, ...) can't grow the tree without bound.
+OTHER_KEY = "$other"
+ARRAY_KEY = "[]"
+
+TYPE_NAMES = {
+    0x01: "double",
+    0x02: "string",
+    0x03: "object",
+    0x04: "array",
+    0x05: "binData",
+    0x06: "undefined",
+    0x07: "objectId",
+    0x08: "bool",
+    0x09: "date",
+    0x0A: "null",
+    0x0B: "regex",
+    0x0C: "dbPointer",
+    0x0D: "javascript",
+    0x0E: "symbol",
+    0x0F: "javascriptWithScope",
+    0x10: "int",
+    0x11: "timestamp",
+    0x12: "long",
+    0x13: "decimal",
+    0xFF: "minKey",
+    0x7F: "maxKey",
+}
+
+class SchemaNode(object):
+    """
+    Summary of all the values seen at one field path.  Children are keyed by
+    field name; all elements of an array are merged into a single child.
+    """
+    __slots__ = ("count", "types", "size", "children", "min_len", "max_len",
+                 "total_len", "arrays")
+
+    def __init__(self):
+        self.count = 0
+        self.types = {}
+        self.size = 0
+        self.children = {}
+        self.min_len = None
+        self.max_len = 0
+        self.total_len = 0
+        self.arrays = 0
+
+    def add_array_length(self, length):
+        self.arrays += 1
+        self.total_len += length
+        self.max_len = max(self.max_len, length)
+        if self.min_len is None or length < self.min_len:
+            self.min_len = length
+
+class SchemaProfile(object):
+    """
+    Merges documents into a schema tree.  Documents are walked as raw BSON so
+    the byte size of every element is known without re-encoding it.
+
+    Each node has at most max_keys children, $other included, and the tree
+    has at most max_nodes nodes plus one $other leaf per node.
+    """
+    def __init__(self, max_keys=1000, max_nodes=10000):
+        self.max_keys = max_keys
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.root = SchemaNode()
+        self.min_size = None
+        self.max_size = 0
+        # Document sizes bucketed by powers of two.
+        self.size_histogram = {}
+
+    def add(self, raw):
+        size = len(raw)
+        self.root.count += 1
+        self.root.size += size
+        self.max_size = max(self.max_size, size)
+        if self.min_size is None or size < self.min_size:
+            self.min_size = size
+        bucket = 1 << (size - 1).bit_length()
+        self.size_histogram[bucket] = self.size_histogram.get(bucket, 0) + 1
+        self._walk(raw, 0, self.root, False)
+
+    def _child(self, parent, key):
+        node = parent.children.get(key)
+        if node is None:
+            if len(parent.children) >= self.max_keys - 1 or self.nodes >= self.max_nodes:
+                key = OTHER_KEY
+                node = parent.children.get(key)
+            if node is None:
+                node = parent.children[key] = SchemaNode()
+                if key != OTHER_KEY:
+                    self.nodes += 1
+        return node
+
+    def _walk(self, data, start, parent, is_array):
+        end = start + struct.unpack_from("<i", data, start)[0] - 1
+        pos = start + 4
+        length = 0
+        while pos < end:
+            element_start = pos
+            element_type = ord(data[pos])
+            key_end = data.index("\x00", pos + 1)
+            if is_array:
+                key = ARRAY_KEY
+            else:
+                key = data[pos + 1:key_end]
+            pos = key_end + 1
+
+            node = self._child(parent, key)
+            type_name = TYPE_NAMES.get(element_type)
+            if type_name is None:
+                raise InvalidBSON("unknown type 0x%02x for key %r" % (element_type, key))
+            node.count += 1
+            node.types[type_name] = node.types.get(type_name, 0) + 1
+
+            # $other merges unrelated keys so it isn't descended into.
+            if node is parent.children.get(OTHER_KEY):
+                pos = raw_value_end(data, element_type, pos)
+            elif element_type == 0x03:
+                pos = self._walk(data, pos, node, False)
+            elif element_type == 0x04:
+                pos = self._walk(data, pos, node, True)
+            else:
+                pos = raw_value_end(data, element_type, pos)
+
+            node.size += pos - element_start
+            length += 1
+
+        if is_array:
+            parent.add_array_length(length)
+        return end + 1
+
+    def rows(self):
+        """
+        Returns (path, node, parent) tuples for every node in the tree.
+        """
+        stack = [("", self.root)]
+        while stack:
+            path, node = stack.pop()
+            for key in sorted(node.children):
+                child = node.children[key]
+                if not path:
+                    child_path = key
+                elif key == ARRAY_KEY:
+                    child_path = path + key
+                else:
+                    child_path = path + "." + key
+                stack.append((child_path, child))
+                yield child_path, child, node
+
+def profile_file(bson_file, max_keys=1000, max_nodes=10000):
+    profile = SchemaProfile(max_keys, max_nodes)
+    for raw in bson_raw_iter(bson_file):
+        profile.add(raw)
+    return profile
+
+def profile_collection(collection, sample_size=1000, max_keys=1000, max_nodes=10000):
+    """
+    Profiles a live collection using $sample so only sample_size documents are
+    read.  A sample_size of 0 scans the whole collection.
+    """
+    collection = collection.with_options(
+        codec_options=CodecOptions(document_class=RawBSONDocument))
+    if sample_size:
+        cursor = collection.aggregate([{"$sample": {"size": sample_size}}])
+    else:
+        cursor = collection.find()
+
+    profile = SchemaProfile(max_keys, max_nodes)
+    for doc in cursor:
+        profile.add(doc.raw)
+    return profile
+
+def get_cli_options():
+    parser = OptionParser(usage="usage: python %prog [options]",
+                          description="""This script profiles the schema of a collection from a mongodump .bson file or a live collection.""")
+
+    parser.add_option("-f", "--file",
+                      dest="file",
+                      default="",
+                      metavar="FILE",
+                      help="Profile a .bson file created by mongodump instead of a live collection")
+    parser.add_option("-H", "--host",
+                      dest="host",
+                      default="localhost",
+                      metavar="HOST",
+                      help="MongoDB host")
+    parser.add_option("-p", "--port",
+                      dest="port",
+                      default=27017,
+                      metavar="PORT",
+                      help="MongoDB port")
+    parser.add_option("-d", "--database",
+                      dest="database",
+                      default="",
+                      metavar="DATABASE",
+                      help="Database of the collection to profile")
+    parser.add_option("-c", "--collection",
+                      dest="collection",
+                      default="",
+                      metavar="COLLECTION",
+                      help="Collection to profile")
+    parser.add_option("-s", "--sample",
+                      dest="sample",
+                      default=1000,
+                      type="int",
+                      metavar="SIZE",
+                      help="Number of documents to $sample, 0 scans the whole collection")
+    parser.add_option("--max-keys",
+                      dest="max_keys",
+                      default=1000,
+                      type="int",
+                      metavar="KEYS",
+                      help="Maximum distinct keys tracked per field before they are folded into $other")
+    parser.add_option("--max-nodes",
+                      dest="max_nodes",
+                      default=10000,
+                      type="int",
+                      metavar="PATHS",
+                      help="Maximum field paths tracked in total before new keys are folded into $other")
+    parser.add_option("-u", "--user",
+                      dest="user",
+                      default="",
+                      metavar="USER",
+                      help="Admin username if authentication is enabled")
+    parser.add_option("--password",
+                      dest="password",
+                      default="",
+                      metavar="PASSWORD",
+                      help="Admin password if authentication is enabled")
+
+    (options, args) = parser.parse_args()
+
+    if not options.file and not (options.database and options.collection):
+        parser.error("either --file or --database and --collection are required")
+
+    return options
+
+def get_client(host, port, username, password):
+    userPass = ""
+    if username and password:
+        userPass = username + ":" + password + "@"
+
+    mongoURI = "mongodb://" + userPass + host + ":" + str(port)
+    return MongoClient(mongoURI)
+
+# From http://www.5dollarwhitebox.org/drupal/node/84
+def convert_bytes(bytes):
+    bytes = float(bytes)
+    magnitude = abs(bytes)
+    if magnitude >= 1099511627776:
+        terabytes = bytes / 1099511627776
+        size = '%.2fT' % terabytes
+    elif magnitude >= 1073741824:
+        gigabytes = bytes / 1073741824
+        size = '%.2fG' % gigabytes
+    elif magnitude >= 1048576:
+        megabytes = bytes / 1048576
+        size = '%.2fM' % megabytes
+    elif magnitude >= 1024:
+        kilobytes = bytes / 1024
+        size = '%.2fK' % kilobytes
+    else:
+        size = '%.2fb' % bytes
+    return size
+
+def format_types(node):
+    types = sorted(node.types.items(), key=lambda t: t[1], reverse=True)
+    return ", ".join("%s (%0.1f%%)" % (name, count * 100.0 / node.count)
+                     for name, count in types)
+
+def print_profile(profile):
+    total_docs = profile.root.count
+    if not total_docs:
+        print "No documents found"
+        return
+
+    x = PrettyTable(["Path", "Types", "% Present", "Avg Size", "% Doc Size", "Array Len (min/avg/max)"])
+    x.align["Path"] = "l"
+    x.align["Types"] = "l"
+    x.align["% Present"] = "r"
+    x.align["Avg Size"] = "r"
+    x.align["% Doc Size"] = "r"
+    x.align["Array Len (min/avg/max)"] = "r"
+    x.padding_width = 1
+
+    for path, node, parent in sorted(profile.rows(), key=lambda row: row[0]):
+        # Presence is relative to the number of embedded documents the field
+        # could have appeared in.  It doesn't apply to array elements or to
+        # $other which merges many keys.
+        if path.endswith(ARRAY_KEY) or path.endswith(OTHER_KEY):
+            present = ""
+        else:
+            present = "%0.1f%%" % (node.count * 100.0 / parent.types.get("object", parent.count))
+        array_len = ""
+        if node.arrays:
+            array_len = "%d/%0.1f/%d" % (node.min_len, node.total_len / float(node.arrays), node.max_len)
+        x.add_row([path, format_types(node), present,
+                   convert_bytes(node.size / float(total_docs)),
+                   "%0.1f%%" % (node.size * 100.0 / profile.root.size),
+                   array_len])
+
+    print x
+    print "Total Documents:", total_docs
+    print "Total Data Size:", convert_bytes(profile.root.size)
+    print "Avg Obj Size:", convert_bytes(profile.root.size / float(total_docs))
+    print "Min/Max Obj Size: %s/%s" % (convert_bytes(profile.min_size), convert_bytes(profile.max_size))
+    print
+
+    x = PrettyTable(["Obj Size <=", "Count", "%"])
+    x.align["Obj Size <="] = "r"
+    x.align["Count"] = "r"
+    x.align["%"] = "r"
+    for bucket in sorted(profile.size_histogram):
+        count = profile.size_histogram[bucket]
+        x.add_row([convert_bytes(bucket), count, "%0.1f%%" % (count * 100.0 / total_docs)])
+    print "Object Size Distribution"
+    print x
+
+def main(options):
+    if options.file:
+        with open(options.file, "rb") as bson_file:
+            profile = profile_file(bson_file, options.max_keys, options.max_nodes)
+    else:
+        client = get_client(options.host, options.port, options.user, options.password)
+        collection = client[options.database][options.collection]
+        print "Profiling: %s" % collection.full_name
+        profile = profile_collection(collection, options.sample, options.max_keys, options.max_nodes)
+
+    print
+    print_profile(profile)
+
+if __name__ == "__main__":
+    options = get_cli_options()
+    main(options)
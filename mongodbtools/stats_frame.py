@@ -0,0 +1,106 @@
+"""
+Column oriented storage for the per collection and per index numbers reported
+by collection-stats and index-stats.  Rather than keeping every collstats
+result around as a dict, only the numeric columns are kept in a numpy array so
+percentages, per database totals, quantiles and rankings are computed in one
+pass over the array and only the top rows need to be rendered.
+"""
+import numpy
+
+class StatsFrame(object):
+    """
+    Rows of int64 columns, each labeled and belonging to a database.
+
+    frame = StatsFrame(["count", "size"])
+    frame.append("examples1", "examples1.user", {"count": 10, "size": 1400})
+    for i in frame.top("size", 5):
+        print frame.labels[i], frame.column("size")[i]
+    """
+    def __init__(self, columns, capacity=1024):
+        self.columns = list(columns)
+        self.index = dict((name, i) for i, name in enumerate(self.columns))
+        self.values = numpy.zeros((capacity, len(self.columns)), dtype=numpy.int64)
+        self.db_codes = numpy.zeros(capacity, dtype=numpy.int32)
+        self.databases = []
+        self.db_index = {}
+        self.labels = []
+
+    def __len__(self):
+        return len(self.labels)
+
+    def append(self, database, label, stats):
+        """
+        Adds a row for label.  The columns are read from the stats dict, with
+        missing ones as 0.
+        """
+        row = len(self.labels)
+        if row == len(self.values):
+            self.values = numpy.resize(self.values, (row * 2, len(self.columns)))
+            self.db_codes = numpy.resize(self.db_codes, row * 2)
+
+        code = self.db_index.get(database)
+        if code is None:
+            code = self.db_index[database] = len(self.databases)
+            self.databases.append(database)
+
+        self.db_codes[row] = code
+        self.values[row] = [stats.get(name, 0) for name in self.columns]
+        self.labels.append(label)
+
+    def column(self, name):
+        return self.values[:len(self.labels), self.index[name]]
+
+    def total(self, name):
+        return int(self.column(name).sum())
+
+    def percent(self, name):
+        """
+        Returns each row's share of the column total, in percent.
+        """
+        values = self.column(name)
+        total = values.sum()
+        if not total:
+            return numpy.zeros(len(values))
+        return values * 100.0 / total
+
+    def ratio(self, numerator, denominator):
+        """
+        Returns numerator / denominator per row, 0 where denominator is 0.
+        """
+        top = self.column(numerator).astype(numpy.float64)
+        bottom = self.column(denominator)
+        result = numpy.zeros(len(top))
+        numpy.divide(top, bottom, out=result, where=bottom != 0)
+        return result
+
+    def group_sum(self, name):
+        """
+        Returns the column summed per database, in the order of self.databases.
+        """
+        sums = numpy.zeros(len(self.databases), dtype=numpy.int64)
+        numpy.add.at(sums, self.db_codes[:len(self.labels)], self.column(name))
+        return sums
+
+    def group_count(self):
+        """
+        Returns the number of rows per database, in the order of self.databases.
+        """
+        return numpy.bincount(self.db_codes[:len(self.labels)], minlength=len(self.databases))
+
+    def quantiles(self, name, percents):
+        if not len(self.labels):
+            return [0] * len(percents)
+        return numpy.percentile(self.column(name), percents)
+
+    def top(self, name, n=0):
+        """
+        Returns the row numbers of the n largest values of the column, largest
+        first.  All rows are returned when n is 0.
+        """
+        if n < 0:
+            raise ValueError("n must be 0 or more, got %s" % n)
+        values = self.column(name)
+        if n and n < len(values):
+            rows = numpy.argpartition(values, len(values) - n)[len(values) - n:]
+            return rows[numpy.argsort(values[rows], kind="mergesort")[::-1]]
+        return numpy.argsort(values, kind="mergesort")[::-1]
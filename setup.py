@@ -19,11 +19,15 @@ setup(
     collection-stats=mongodbtools.collection_stats:main
     index-stats=mongodbtools.index_stats:main
     redundant-indexes=mongodbtools.redundant_indexes:main
+    schema-profile=mongodbtools.schema_profile:main
+    dump-diff=mongodbtools.dump_diff:main
+    dump-restore=mongodbtools.dump_restore:main
     """,
     install_requires=[
         'pymongo>=2.1',
         'PrettyTable>=0.7.1',
         'psutil==0.3.0',
-        'mongoengine==0.5.0'
+        'mongoengine==0.5.0',
+        'numpy>=1.8'
     ],
 )
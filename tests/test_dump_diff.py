@@ -0,0 +1,121 @@
+import os
+import heapq
+import random
+import shutil
+import tempfile
+import unittest
+import bson
+from bson.int64 import Int64
+from bson.objectid import ObjectId
+from bson.son import SON
+from mongodbtools import dump_diff
+
+def write_bson(path, docs):
+    with open(path, "wb") as bson_file:
+        for doc in docs:
+            bson_file.write(bson.BSON.encode(doc))
+
+class RawIdTest(unittest.TestCase):
+
+    def test_id_types(self):
+        oid = ObjectId()
+        ids = [oid, 1, Int64(1), 1.0, "1", u"caf\xe9", {"a": 1, "b": 2}, [1, 2], None, True]
+        keys = [dump_diff.raw_id(bson.BSON.encode({"_id": _id})) for _id in ids]
+        self.assertEqual(len(set(keys)), len(ids))
+        self.assertEqual(keys[0], dump_diff.raw_id(bson.BSON.encode(SON([("x", 1), ("_id", oid)]))))
+
+    def test_missing_id(self):
+        self.assertRaises(bson.errors.InvalidBSON, dump_diff.raw_id, bson.BSON.encode({"a": 1}))
+
+class DumpDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_path = os.path.join(self.tmpdir, "old.bson")
+        self.new_path = os.path.join(self.tmpdir, "new.bson")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def diff(self, old_docs, new_docs, **kwargs):
+        write_bson(self.old_path, old_docs)
+        write_bson(self.new_path, new_docs)
+        result = [(op, (old or new)["_id"]) for op, old, new in
+                  dump_diff.diff_dumps(self.old_path, self.new_path, self.tmpdir, **kwargs)]
+        # The sort runs are removed along with diff_dumps' work directory.
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["new.bson", "old.bson"])
+        return sorted(result)
+
+    def sample(self):
+        old_docs = [{"_id": i, "v": i} for i in range(100)]
+        new_docs = [{"_id": i, "v": -i if i % 10 == 0 else i} for i in range(100) if i % 7]
+        new_docs += [{"_id": "new%d" % i} for i in range(3)]
+        expected = sorted([("delete", i) for i in range(100) if i % 7 == 0] +
+                          [("change", i) for i in range(1, 100) if i % 10 == 0 and i % 7] +
+                          [("insert", "new%d" % i) for i in range(3)])
+        return old_docs, new_docs, expected
+
+    def test_sorted_inputs(self):
+        old_docs, new_docs, expected = self.sample()
+        new_docs.sort(key=lambda doc: dump_diff.raw_id(bson.BSON.encode(doc)))
+        self.assertEqual(self.diff(old_docs, new_docs), expected)
+
+    def test_unsorted_inputs(self):
+        old_docs, new_docs, expected = self.sample()
+        random.Random(1).shuffle(old_docs)
+        random.Random(2).shuffle(new_docs)
+        self.assertEqual(self.diff(old_docs, new_docs), expected)
+
+    def test_multi_pass_merge(self):
+        old_docs, new_docs, expected = self.sample()
+        random.Random(3).shuffle(old_docs)
+        random.Random(4).shuffle(new_docs)
+        self.assertEqual(self.diff(old_docs, new_docs, chunk_size=1), expected)
+        self.assertEqual(self.diff(old_docs, new_docs, chunk_size=1, fan_in=2), expected)
+        self.assertEqual(self.diff(old_docs, new_docs, chunk_size=3, fan_in=4), expected)
+
+    def test_only_inserts(self):
+        docs = [{"_id": i} for i in range(10, 0, -1)]
+        self.assertEqual(self.diff([], docs, chunk_size=1),
+                         [("insert", i) for i in range(1, 11)])
+
+    def test_only_deletes(self):
+        docs = [{"_id": i} for i in range(10, 0, -1)]
+        self.assertEqual(self.diff(docs, [], chunk_size=1),
+                         [("delete", i) for i in range(1, 11)])
+
+    def test_identical(self):
+        docs = [{"_id": i, "v": [i]} for i in range(20, 0, -1)]
+        self.assertEqual(self.diff(docs, docs, chunk_size=2, fan_in=2), [])
+
+    def test_without_decoding(self):
+        old_docs, new_docs, expected = self.sample()
+        random.Random(5).shuffle(old_docs)
+        write_bson(self.old_path, old_docs)
+        write_bson(self.new_path, new_docs)
+
+        def read_doc(bson_file, offset):
+            self.fail("read_doc called with decode=False")
+        original, dump_diff.read_doc = dump_diff.read_doc, read_doc
+        try:
+            result = list(dump_diff.diff_dumps(self.old_path, self.new_path, self.tmpdir,
+                                               chunk_size=7, decode=False))
+        finally:
+            dump_diff.read_doc = original
+
+        self.assertEqual(sorted(op for op, old, new in result), sorted(op for op, _id in expected))
+        with open(self.new_path, "rb") as new_file:
+            inserted = [dump_diff.read_doc(new_file, new)["_id"]
+                        for op, old, new in result if op == "insert"]
+        self.assertEqual(inserted, ["new0", "new1", "new2"])
+
+    def test_merge_runs_bounds_fan_in(self):
+        runs = [dump_diff._write_run([(chr(i), "d" * 16, i)], self.tmpdir) for i in range(10)]
+        merged = dump_diff._merge_runs(runs, self.tmpdir, fan_in=3)
+        self.assertTrue(len(merged) <= 3)
+        self.assertEqual(len(os.listdir(self.tmpdir)), len(merged))
+        entries = list(heapq.merge(*[dump_diff._read_run(run) for run in merged]))
+        self.assertEqual([offset for key, digest, offset in entries], range(10))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import bson
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+from mongodbtools import dump_restore
+from mongodbtools.query.helpers import raw_id
+
+def raw_docs(docs):
+    return [RawBSONDocument(bson.BSON.encode(doc)) for doc in docs]
+
+class FakeCollection(object):
+    """
+    Enough of a pymongo collection for write_batch and restore.  Inserts fail
+    with a duplicate key error like the server does, for _id and for the
+    fields in unique.
+    """
+    def __init__(self, fail_after=None, unique=()):
+        self.docs = {}
+        self.unique = dict((field, set()) for field in unique)
+        self.inserts = 0
+        self.finds = 0
+        self.fail_after = fail_after
+
+    def with_options(self, codec_options=None):
+        return self
+
+    def insert_many(self, docs, ordered=True):
+        self.inserts += 1
+        if self.fail_after is not None and self.inserts > self.fail_after:
+            raise RuntimeError("connection lost")
+        errors = []
+        inserted = 0
+        for i, doc in enumerate(docs):
+            key = raw_id(doc.raw)
+            values = dict((field, doc.get(field)) for field in self.unique)
+            if key in self.docs or any(values[field] in self.unique[field] for field in values):
+                errors.append({"index": i, "code": dump_restore.DUPLICATE_KEY})
+                if ordered:
+                    break
+            else:
+                self.docs[key] = doc
+                for field in values:
+                    self.unique[field].add(values[field])
+                inserted += 1
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+
+    def find(self, query, projection):
+        self.finds += 1
+        ids = [raw_id(bson.BSON.encode({"_id": _id})) for _id in query["_id"]["$in"]]
+        return [self.docs[key] for key in ids if key in self.docs]
+
+class MatchesTest(unittest.TestCase):
+
+    def test_nested_paths(self):
+        doc = {"a": {"b": {"c": 1}}, "c": 2}
+        self.assertTrue(dump_restore.matches(doc, {"a.b.c": 1}))
+        self.assertFalse(dump_restore.matches(doc, {"a.b.c": 2}))
+        self.assertTrue(dump_restore.matches(doc, {"a.b.c": 1, "c": 2}))
+
+    def test_non_document_intermediates(self):
+        query = {"address.zip": 10001}
+        for address in ("foo", 5, [{"zip": 10001}], None):
+            self.assertFalse(dump_restore.matches({"address": address}, query))
+
+    def test_dates(self):
+        query = json_util.loads('{"created": {"$date": 1451606400000}}')
+        bson_path = tempfile.mktemp(suffix=".bson")
+        try:
+            with open(bson_path, "wb") as bson_file:
+                for day in (1, 2):
+                    bson_file.write(bson.BSON.encode({"_id": day, "created": datetime.datetime(2016, 1, day)}))
+            batches = list(dump_restore.read_batches(bson_path, 0, query, dump_restore.BatchSizer(),
+                                                     dump_restore.RestoreStats()))
+        finally:
+            os.remove(bson_path)
+        self.assertEqual([doc["_id"] for doc in batches[-1][0]], [1])
+
+    def test_missing_paths_never_match(self):
+        self.assertFalse(dump_restore.matches({}, {"a.b": False}))
+        self.assertFalse(dump_restore.matches({"a": {}}, {"a.b": None}))
+        self.assertTrue(dump_restore.matches({"a": {"b": False}}, {"a.b": False}))
+
+class WriteBatchTest(unittest.TestCase):
+
+    def test_insert(self):
+        collection = FakeCollection()
+        docs = raw_docs({"_id": i} for i in range(10))
+        written, duplicates, written_bytes = dump_restore.write_batch(collection, docs)
+        self.assertEqual((written, duplicates), (10, 0))
+        self.assertEqual(written_bytes, sum(len(doc.raw) for doc in docs))
+
+    def test_unordered_duplicates(self):
+        collection = FakeCollection()
+        dump_restore.write_batch(collection, raw_docs({"_id": i} for i in range(0, 10, 2)))
+        docs = raw_docs({"_id": i} for i in range(10))
+        written, duplicates, written_bytes = dump_restore.write_batch(collection, docs)
+        self.assertEqual((written, duplicates), (5, 5))
+        self.assertEqual(written_bytes, sum(len(doc.raw) for doc in docs[1::2]))
+        self.assertEqual(len(collection.docs), 10)
+
+    def test_ordered_duplicates_take_one_lookup(self):
+        collection = FakeCollection()
+        dump_restore.write_batch(collection, raw_docs({"_id": i} for i in range(1000)), ordered=True)
+        collection.inserts = 0
+        docs = raw_docs({"_id": i} for i in range(500, 1500))
+        written, duplicates, written_bytes = dump_restore.write_batch(collection, docs, ordered=True)
+        self.assertEqual((written, duplicates), (500, 500))
+        self.assertEqual(written_bytes, sum(len(doc.raw) for doc in docs[500:]))
+        self.assertEqual((collection.inserts, collection.finds), (2, 1))
+        self.assertEqual(len(collection.docs), 1500)
+
+    def test_unique_index_conflicts_raise(self):
+        for ordered in (False, True):
+            collection = FakeCollection(unique=["email"])
+            dump_restore.write_batch(collection, raw_docs({"_id": i, "email": i} for i in range(5)))
+            # 3 and 4 are already there, 7 is new but clashes on email.
+            docs = raw_docs([{"_id": 3, "email": 3}, {"_id": 4, "email": 4},
+                             {"_id": 6, "email": 6}, {"_id": 7, "email": 1}])
+            self.assertRaises(BulkWriteError, dump_restore.write_batch, collection, docs,
+                              ordered=ordered)
+            self.assertEqual(sorted(collection.docs), sorted(raw_id(doc.raw) for doc in
+                             raw_docs({"_id": i} for i in (0, 1, 2, 3, 4, 6))))
+
+    def test_other_errors_raise(self):
+        class Failing(FakeCollection):
+            def insert_many(self, docs, ordered=True):
+                raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121}], "nInserted": 0})
+        self.assertRaises(BulkWriteError, dump_restore.write_batch,
+                          Failing(), raw_docs([{"_id": 1}]))
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_out_of_order(self):
+        checkpoint = dump_restore.Checkpoint(self.path)
+        checkpoint.finish(1, "a.bson", 200)
+        checkpoint.finish(2, "a.bson", 300)
+        self.assertEqual(checkpoint.offset("a.bson"), 0)
+        self.assertFalse(os.path.exists(self.path))
+
+        checkpoint.finish(0, "a.bson", 100)
+        self.assertEqual(checkpoint.offset("a.bson"), 300)
+
+        checkpoint.finish(4, "b.bson", 50)
+        checkpoint.finish(3, "a.bson", 400)
+        self.assertEqual(checkpoint.offset("a.bson"), 400)
+        self.assertEqual(checkpoint.offset("b.bson"), 50)
+
+        with open(self.path) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file), {os.path.abspath("a.bson"): 400,
+                                                          os.path.abspath("b.bson"): 50})
+        self.assertEqual(dump_restore.Checkpoint(self.path).offset("a.bson"), 400)
+
+    def test_paths_are_absolute(self):
+        checkpoint = dump_restore.Checkpoint(self.path)
+        checkpoint.finish(0, "dump/x.bson", 100)
+        checkpoint = dump_restore.Checkpoint(self.path)
+        self.assertEqual(checkpoint.offset("./dump/x.bson"), 100)
+        self.assertEqual(checkpoint.offset(os.path.join(os.getcwd(), "dump", "x.bson")), 100)
+        self.assertEqual(checkpoint.offset("dump/y.bson"), 0)
+
+    def test_resume(self):
+        bson_path = os.path.join(self.tmpdir, "docs.bson")
+        with open(bson_path, "wb") as bson_file:
+            for i in range(500):
+                bson_file.write(bson.BSON.encode({"_id": i, "pad": "x" * 100}))
+
+        def sizer():
+            return dump_restore.BatchSizer(1024, min_bytes=1024, max_bytes=1024)
+
+        collection = FakeCollection(fail_after=10)
+        self.assertRaises(RuntimeError, dump_restore.restore, collection, [bson_path],
+                          writers=3, sizer=sizer(), checkpoint=dump_restore.Checkpoint(self.path))
+        offset = dump_restore.Checkpoint(self.path).offset(bson_path)
+        self.assertTrue(0 < offset < os.path.getsize(bson_path))
+        written = len(collection.docs)
+
+        collection.fail_after = None
+        stats = dump_restore.restore(collection, [bson_path], writers=3, sizer=sizer(),
+                                     checkpoint=dump_restore.Checkpoint(self.path))
+        self.assertEqual(len(collection.docs), 500)
+        self.assertEqual(written + stats.written, 500)
+        self.assertEqual(dump_restore.Checkpoint(self.path).offset(bson_path),
+                         os.path.getsize(bson_path))
+
+    def test_needs_a_writer(self):
+        self.assertRaises(ValueError, dump_restore.restore, FakeCollection(), [], writers=0)
+
+    def test_query(self):
+        bson_path = os.path.join(self.tmpdir, "docs.bson")
+        with open(bson_path, "wb") as bson_file:
+            for i in range(100):
+                bson_file.write(bson.BSON.encode({"_id": i, "a": {"b": i % 3} if i % 2 else "flat"}))
+        collection = FakeCollection()
+        stats = dump_restore.restore(collection, [bson_path], {"a.b": 1})
+        self.assertEqual((stats.scanned, stats.matched, stats.written), (100, 17, 17))
+
+class BatchSizerTest(unittest.TestCase):
+
+    def test_moves_half_way_towards_target(self):
+        sizer = dump_restore.BatchSizer(1000, min_bytes=100, max_bytes=100000, target_seconds=1)
+        sizer.record(1000, 0.1)
+        self.assertEqual(sizer.batch_bytes, 5500)
+        sizer.record(5500, 1)
+        self.assertEqual(sizer.batch_bytes, 5500)
+
+    def test_clamped(self):
+        sizer = dump_restore.BatchSizer(1000, min_bytes=500, max_bytes=2000, target_seconds=1)
+        sizer.record(1000, 0)
+        self.assertEqual(sizer.batch_bytes, 2000)
+        for i in range(10):
+            sizer.record(10, 10)
+        self.assertEqual(sizer.batch_bytes, 500)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import datetime
+import struct
+import unittest
+from StringIO import StringIO
+import bson
+from bson.errors import InvalidBSON
+from mongodbtools.query.helpers import bson_iter, bson_raw_iter
+
+class BsonIterTest(unittest.TestCase):
+
+    def test_decodes_tz_aware_datetimes(self):
+        when = datetime.datetime(2016, 1, 2, 3, 4, 5)
+        docs = list(bson_iter(StringIO(bson.BSON.encode({"when": when}))))
+        self.assertEqual(len(docs), 1)
+        self.assertTrue(docs[0]["when"].tzinfo is not None)
+        self.assertEqual(docs[0]["when"].replace(tzinfo=None), when)
+
+    def test_rejects_small_object_sizes(self):
+        for size in (-1, 0, 4):
+            data = StringIO(struct.pack("<i", size) + "\x00" * 8)
+            self.assertRaises(InvalidBSON, list, bson_raw_iter(data))
+
+    def test_rejects_truncated_docs(self):
+        raw = bson.BSON.encode({"a": 1})
+        self.assertRaises(InvalidBSON, list, bson_raw_iter(StringIO(raw[:-2])))
+        self.assertRaises(InvalidBSON, list, bson_raw_iter(StringIO(raw + raw[:2])))
+
+if __name__ == "__main__":
+    unittest.main()
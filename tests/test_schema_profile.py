@@ -0,0 +1,45 @@
+import unittest
+import bson
+from mongodbtools.schema_profile import SchemaProfile, OTHER_KEY
+
+def profile(docs, **kwargs):
+    schema = SchemaProfile(**kwargs)
+    for doc in docs:
+        schema.add(bson.BSON.encode(doc))
+    return schema
+
+def count_nodes(node):
+    return sum(1 + count_nodes(child) for child in node.children.values())
+
+class SchemaProfileTest(unittest.TestCase):
+
+    def test_attributes_every_byte(self):
+        docs = [{"a": i, "b": {"c": "x" * i}, "d": [1, "two", {"e": None}]} for i in range(10)]
+        schema = profile(docs)
+        top_level = sum(child.size for child in schema.root.children.values())
+        self.assertEqual(schema.root.size, top_level + 5 * len(docs))
+        self.assertEqual(schema.root.children["d"].arrays, 10)
+        self.assertEqual(schema.root.children["d"].children["[]"].count, 30)
+
+    def test_max_keys_includes_other(self):
+        schema = profile([{"k%d" % i: i for i in range(20)}], max_keys=5)
+        self.assertEqual(len(schema.root.children), 5)
+        self.assertEqual(schema.root.children[OTHER_KEY].count, 16)
+
+    def test_max_nodes_bounds_nested_dynamic_keys(self):
+        docs = [{"stats": dict(("d%d" % day, dict(("u%d" % user, {"n": 1}) for user in range(50)))
+                               for day in range(50))}]
+        schema = profile(docs, max_keys=1000, max_nodes=100)
+        self.assertEqual(schema.nodes, 100)
+        # Every node can have at most one $other leaf on top of the budget.
+        self.assertTrue(count_nodes(schema.root) <= 2 * 100)
+
+    def test_other_is_a_leaf(self):
+        docs = [{"k%d" % i: {"nested": {"deeper": i}} for i in range(10)}]
+        schema = profile(docs, max_keys=3)
+        other = schema.root.children[OTHER_KEY]
+        self.assertEqual(other.children, {})
+        self.assertEqual(other.types, {"object": 8})
+
+if __name__ == "__main__":
+    unittest.main()
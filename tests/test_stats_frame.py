@@ -0,0 +1,75 @@
+import unittest
+from mongodbtools.stats_frame import StatsFrame
+
+class StatsFrameTest(unittest.TestCase):
+
+    def frame(self):
+        frame = StatsFrame(["count", "size"], capacity=2)
+        frame.append("db1", "db1.a", {"count": 10, "size": 1000})
+        frame.append("db2", "db2.a", {"count": 0, "size": 0})
+        frame.append("db1", "db1.b", {"count": 4, "size": 1000})
+        frame.append("db1", "db1.c", {"size": 3000})
+        frame.append("db2", "db2.b", {"count": 2, "size": 5000})
+        return frame
+
+    def test_grows_past_capacity(self):
+        frame = self.frame()
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(list(frame.column("size")), [1000, 0, 1000, 3000, 5000])
+        self.assertEqual(list(frame.column("count")), [10, 0, 4, 0, 2])
+        self.assertEqual(frame.labels, ["db1.a", "db2.a", "db1.b", "db1.c", "db2.b"])
+
+        for i in range(1000):
+            frame.append("db3", i, {"size": i})
+        self.assertEqual(len(frame), 1005)
+        self.assertEqual(frame.total("size"), 10000 + sum(range(1000)))
+
+    def test_group_by_database(self):
+        frame = self.frame()
+        self.assertEqual(frame.databases, ["db1", "db2"])
+        self.assertEqual(list(frame.group_sum("size")), [5000, 5000])
+        self.assertEqual(list(frame.group_sum("count")), [14, 2])
+        self.assertEqual(list(frame.group_count()), [3, 2])
+
+    def test_percent(self):
+        self.assertEqual(list(self.frame().percent("size")), [10.0, 0.0, 10.0, 30.0, 50.0])
+        frame = StatsFrame(["size"])
+        frame.append("db", "db.a", {"size": 0})
+        self.assertEqual(list(frame.percent("size")), [0.0])
+
+    def test_ratio_with_zero_counts(self):
+        self.assertEqual(list(self.frame().ratio("size", "count")), [100.0, 0.0, 250.0, 0.0, 2500.0])
+
+    def test_top(self):
+        frame = self.frame()
+        self.assertEqual(list(frame.top("size", 1)), [4])
+        self.assertEqual(list(frame.top("size", 2)), [4, 3])
+        # Rows 0 and 2 tie, either may come first but both are returned.
+        self.assertEqual(sorted(frame.top("size", 4)[2:]), [0, 2])
+        self.assertEqual(list(frame.top("size", 5)[:2]), [4, 3])
+        self.assertEqual(list(frame.top("size", 10)[:2]), [4, 3])
+
+    def test_top_all(self):
+        frame = self.frame()
+        rows = list(frame.top("size"))
+        self.assertEqual(rows[:2], [4, 3])
+        self.assertEqual(sorted(rows[2:4]), [0, 2])
+        self.assertEqual(rows[4], 1)
+
+    def test_top_negative(self):
+        self.assertRaises(ValueError, self.frame().top, "size", -1)
+
+    def test_empty(self):
+        frame = StatsFrame(["size"])
+        self.assertEqual(list(frame.top("size", 5)), [])
+        self.assertEqual(frame.quantiles("size", [50, 90]), [0, 0])
+        self.assertEqual(list(frame.group_count()), [])
+
+    def test_quantiles(self):
+        frame = StatsFrame(["size"])
+        for i in range(101):
+            frame.append("db", i, {"size": i})
+        self.assertEqual(list(frame.quantiles("size", [50, 90, 99])), [50, 90, 99])
+
+if __name__ == "__main__":
+    unittest.main()